@@ -1,27 +1,165 @@
 # dataentry.py — Finance Tracker (username + 10-char passcode)
 
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
-import plotly.express as px
-import sqlite3, bcrypt
-from contextlib import contextmanager
+import plotly.graph_objects as go
+import sqlite3, bcrypt, threading, hmac, secrets, time
+import datetime as dt
+from io import BytesIO
 from typing import Optional
 
 #  DB HELPERS
 DB_PATH = "finance.db"
-
-@contextmanager
-def db():
-    conn = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.execute("PRAGMA foreign_keys = ON")
+CACHE_MAX_ENTRIES = 64  # per cached query helper; stale tx versions get evicted
+BCRYPT_ROUNDS = 10  # ~4x faster than the default 12; older hashes are upgraded at login
+SESSION_TOKEN_TTL = 12 * 60 * 60  # seconds; sessions closed without signing out expire
+SESSION_TOKENS_PER_USER = 10  # oldest token is dropped beyond this
+
+# Explicit DATE <-> datetime.date mapping (the sqlite3 defaults are deprecated)
+sqlite3.register_adapter(dt.date, lambda d: d.isoformat())
+def _convert_date(raw: bytes):
+    # Malformed values come back as the raw string for _tx_frame to coerce to NaT,
+    # rather than raising inside fetchall() and breaking every read
+    text = raw.decode("utf-8", errors="replace")
     try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
-
+        return dt.date.fromisoformat(text)
+    except ValueError:
+        return text
+
+sqlite3.register_converter("DATE", _convert_date)
+
+# Hot-path statements. Reusing the same text lets sqlite3's per-connection
+# statement cache skip re-preparing them on the shared connection.
+# "{in_list}" is filled with one "?" per picked category.
+SQL_GET_USER_ID = "SELECT id FROM users WHERE username=?"
+SQL_GET_USER_AUTH = "SELECT id, passcode_hash FROM users WHERE username=?"
+SQL_INSERT_USER = "INSERT INTO users(username, passcode_hash) VALUES(?,?)"
+SQL_UPDATE_PASSCODE = "UPDATE users SET passcode_hash=? WHERE id=?"
+SQL_LIST_TX = """
+    SELECT date, amount, category, description
+    FROM transactions
+    WHERE user_id=?
+    ORDER BY date ASC, id ASC
+"""
+SQL_LIST_TX_FILTERED = """
+    SELECT date, amount, category, description
+    FROM transactions
+    WHERE user_id=? AND date BETWEEN ? AND ? AND category IN ({in_list})
+    ORDER BY date ASC, id ASC
+"""
+SQL_DISTINCT_CATEGORIES = """
+    SELECT DISTINCT category
+    FROM transactions
+    WHERE user_id=? AND date BETWEEN ? AND ?
+    ORDER BY category
+"""
+SQL_CATEGORY_TOTALS = """
+    SELECT category, SUM(amount) AS amount
+    FROM transactions
+    WHERE user_id=? AND date BETWEEN ? AND ? AND category IN ({in_list})
+    GROUP BY category
+    ORDER BY amount DESC
+"""
+SQL_INSERT_TX = """
+    INSERT INTO transactions(user_id, date, amount, category, description)
+    VALUES(?,?,?,?,?)
+"""
+SQL_DELETE_USER_TX = "DELETE FROM transactions WHERE user_id=?"
+
+@st.cache_resource
+def get_conn() -> sqlite3.Connection:
+    """
+    One long-lived connection per process, shared across reruns and sessions.
+    Every use goes through _db_lock() since the connection crosses threads.
+    """
+    conn = sqlite3.connect(
+        DB_PATH, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=256
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+@st.cache_resource
+def _db_lock() -> threading.Lock:
+    return threading.Lock()
+
+def hash_passcode(passcode: str) -> bytes:
+    return bcrypt.hashpw(passcode.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+@st.cache_resource
+def _dummy_hash() -> bytes:
+    # Checked against when a username doesn't exist, so misses cost as much as hits.
+    # Uses BCRYPT_ROUNDS like every new or re-hashed account; only legacy cost-12
+    # accounts that haven't logged in since the cost was lowered still differ.
+    return hash_passcode("x" * 10)
+
+@st.cache_resource
+def _tx_versions() -> dict:
+    # user_id -> counter bumped on every write; part of the cache key for reads
+    return {}
+
+def tx_version(user_id: int) -> int:
+    return _tx_versions().get(user_id, 0)
+
+def _bump_tx_version(user_id: int):
+    versions = _tx_versions()
+    versions[user_id] = versions.get(user_id, 0) + 1
+
+@st.cache_resource
+def _session_tokens() -> dict:
+    # user_id -> {token: issued_at} for tokens issued at login; lets writes skip re-running bcrypt
+    return {}
+
+@st.cache_resource
+def _token_lock() -> threading.Lock:
+    # Session threads share _session_tokens(); hold this around every read/write of it
+    return threading.Lock()
+
+def _live_tokens(user_id: int) -> dict:
+    # Caller holds _token_lock()
+    issued = _session_tokens().setdefault(user_id, {})
+    cutoff = time.monotonic() - SESSION_TOKEN_TTL
+    for t, issued_at in list(issued.items()):
+        if issued_at < cutoff:
+            del issued[t]
+    return issued
+
+def issue_session_token(user_id: int) -> bytes:
+    token = secrets.token_bytes(32)
+    with _token_lock():
+        issued = _live_tokens(user_id)
+        while len(issued) >= SESSION_TOKENS_PER_USER:
+            del issued[min(issued, key=issued.get)]
+        issued[token] = time.monotonic()
+    return token
+
+def check_session_token(user_id: int, token: Optional[bytes]) -> bool:
+    if token is None:
+        return False
+    with _token_lock():
+        issued = list(_live_tokens(user_id))
+    return any(hmac.compare_digest(token, t) for t in issued)
+
+def revoke_session_token(user_id: int, token: Optional[bytes]):
+    with _token_lock():
+        _session_tokens().get(user_id, {}).pop(token, None)
+
+def revoke_other_session_tokens(user_id: int, keep: Optional[bytes]):
+    with _token_lock():
+        issued = _session_tokens().get(user_id, {})
+        for t in list(issued):
+            if t != keep:
+                del issued[t]
+
+@st.cache_resource
 def init_db():
-    with db() as conn:
+    """Create tables and indexes; cached so the DDL runs once per process, not per rerun."""
+    conn = get_conn()
+    with _db_lock(), conn:
         # Users: username + passcode_hash (only)
         conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -36,18 +174,30 @@ def init_db():
         CREATE TABLE IF NOT EXISTS transactions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
+            date DATE NOT NULL,
             amount REAL NOT NULL,
             category TEXT NOT NULL,
             description TEXT,
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
         """)
+        # (user_id, date, id) serves both the full and the filtered listing
+        conn.execute("DROP INDEX IF EXISTS ix_tx_user_date")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_tx_user_date_id ON transactions(user_id, date, id)")
+
+        # Collect planner statistics until some exist. ANALYZE on empty tables creates
+        # sqlite_stat1 with no rows, so check its contents rather than its existence.
+        has_stats_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'"
+        ).fetchone()
+        if not (has_stats_table and conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone()):
+            conn.execute("ANALYZE")
 
 def get_user_id_by_username(username: str) -> Optional[int]:
-    with db() as conn:
-        row = conn.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
-        return row[0] if row else None
+    conn = get_conn()
+    with _db_lock():
+        row = conn.execute(SQL_GET_USER_ID, (username,)).fetchone()
+    return row[0] if row else None
 
 def create_user(username: str, passcode: str) -> Optional[int]:
     """
@@ -58,12 +208,10 @@ def create_user(username: str, passcode: str) -> Optional[int]:
         return None
     if get_user_id_by_username(username) is not None:
         return None
-    p_hash = bcrypt.hashpw(passcode.encode("utf-8"), bcrypt.gensalt())
-    with db() as conn:
-        cur = conn.execute(
-            "INSERT INTO users(username, passcode_hash) VALUES(?,?)",
-            (username, p_hash)
-        )
+    p_hash = hash_passcode(passcode)
+    conn = get_conn()
+    with _db_lock(), conn:
+        cur = conn.execute(SQL_INSERT_USER, (username, p_hash))
         return cur.lastrowid
 
 def verify_user(username: str, passcode: str) -> Optional[int]:
@@ -73,52 +221,177 @@ def verify_user(username: str, passcode: str) -> Optional[int]:
     """
     if not username or passcode is None:
         return None
-    with db() as conn:
-        row = conn.execute(
-            "SELECT id, passcode_hash FROM users WHERE username=?",
-            (username,)
-        ).fetchone()
-    if not row:
+    conn = get_conn()
+    with _db_lock():
+        row = conn.execute(SQL_GET_USER_AUTH, (username,)).fetchone()
+    uid, stored = row if row else (None, _dummy_hash())
+    ok = bcrypt.checkpw(passcode.encode("utf-8"), stored)
+    if uid is None or not ok:
         return None
-    uid, stored = row
-    if bcrypt.checkpw(passcode.encode("utf-8"), stored):
-        return uid
-    return None
-
-def list_transactions(user_id: int) -> pd.DataFrame:
-    with db() as conn:
-        rows = conn.execute("""
-            SELECT date, amount, category, description
-            FROM transactions
-            WHERE user_id=?
-            ORDER BY date ASC, id ASC
-        """, (user_id,)).fetchall()
-    return pd.DataFrame(rows, columns=["date", "amount", "category", "description"])
-
-def insert_transaction(user_id: int, date: str, amount: float, category: str, description: str):
-    with db() as conn:
-        conn.execute("""
-            INSERT INTO transactions(user_id, date, amount, category, description)
-            VALUES(?,?,?,?,?)
-        """, (user_id, date, amount, category, description))
+    # Re-hash at the current cost ("$2b$NN$...") so legacy hashes age out
+    if bytes(stored[4:6]) != b"%02d" % BCRYPT_ROUNDS:
+        update_passcode(uid, hash_passcode(passcode))
+    return uid
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def list_transactions(user_id: int, version: int) -> pd.DataFrame:
+    """
+    All of a user's transactions. `version` is only a cache key:
+    pass tx_version(user_id) so writes invalidate the cached frame.
+    """
+    conn = get_conn()
+    with _db_lock():
+        rows = conn.execute(SQL_LIST_TX, (user_id,)).fetchall()
+    return _tx_frame(rows)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def list_transactions_filtered(user_id: int, start_date, end_date, categories: tuple, version: int) -> pd.DataFrame:
+    """
+    A user's transactions within [start_date, end_date] whose category is in `categories`.
+    Filtering happens in SQLite so only matching rows are loaded.
+    """
+    sql = SQL_LIST_TX_FILTERED.format(in_list=",".join("?" * len(categories)))
+    conn = get_conn()
+    with _db_lock():
+        rows = conn.execute(sql, (user_id, start_date, end_date, *categories)).fetchall()
+    return _tx_frame(rows)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def tx_table(user_id: int, start_date, end_date, categories: tuple, version: int) -> pa.Table:
+    """
+    list_transactions_filtered as an Arrow table for st.dataframe, so the
+    pandas -> Arrow conversion happens once per filter/version, not per rerun.
+    """
+    df = list_transactions_filtered(user_id, start_date, end_date, categories, version)
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def distinct_categories(user_id: int, start_date, end_date, version: int) -> list:
+    """Sorted categories a user has transactions in between start_date and end_date."""
+    conn = get_conn()
+    with _db_lock():
+        rows = conn.execute(SQL_DISTINCT_CATEGORIES, (user_id, start_date, end_date)).fetchall()
+    return [r[0] for r in rows]
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def category_totals(user_id: int, start_date, end_date, categories: tuple, version: int) -> pd.DataFrame:
+    """Per-category `amount` totals over the same filter as list_transactions_filtered, largest first."""
+    sql = SQL_CATEGORY_TOTALS.format(in_list=",".join("?" * len(categories)))
+    conn = get_conn()
+    with _db_lock():
+        rows = conn.execute(sql, (user_id, start_date, end_date, *categories)).fetchall()
+    return pd.DataFrame(rows, columns=["category", "amount"])
+
+@st.cache_resource
+def empty_tx() -> pd.DataFrame:
+    # Shared, schema-preserving result for "no rows"; built once per process, treat as read-only
+    return pd.DataFrame({
+        "date": pd.Series(dtype="datetime64[ns]"),
+        "amount": pd.Series(dtype="float64"),
+        "category": pd.Series(dtype="object"),
+        "description": pd.Series(dtype="object"),
+    })
+
+def _tx_frame(rows) -> pd.DataFrame:
+    if not rows:
+        return empty_tx()
+    df = pd.DataFrame(rows, columns=["date", "amount", "category", "description"])
+    # The single date conversion; older databases still hold dates as TEXT
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
+    return df
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def monthly_sum(user_id: int, start_date, end_date, categories: tuple, version: int) -> pd.DataFrame:
+    """
+    Total amount per calendar month over the list_transactions_filtered rows,
+    as `month` ("YYYY-MM") and `amount` columns.
+    """
+    df = list_transactions_filtered(user_id, start_date, end_date, categories, version)
+    summary = (
+        df.dropna(subset=["date"])
+          .groupby(pd.Grouper(key="date", freq="MS"))["amount"]
+          .sum()
+          .reset_index()
+    )
+    summary["month"] = summary["date"].dt.strftime("%Y-%m")
+    return summary[["month", "amount"]]
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def export_csv(user_id: int, version: int) -> bytes:
+    """UTF-8 CSV of all of a user's transactions, for the download button."""
+    buf = BytesIO()
+    list_transactions(user_id, version).to_csv(buf, index=False, encoding="utf-8")
+    return buf.getvalue()
+
+def insert_transaction(user_id: int, date: dt.date, amount: float, category: str, description: str):
+    conn = get_conn()
+    with _db_lock(), conn:
+        conn.execute(SQL_INSERT_TX, (user_id, date, amount, category, description))
+        _bump_tx_version(user_id)
+
+def _as_date(value) -> dt.date:
+    # datetime / pd.Timestamp would be stored with a time part the DATE converter rejects
+    if isinstance(value, dt.datetime):
+        return value.date()
+    if isinstance(value, dt.date):
+        return value
+    return dt.date.fromisoformat(str(value).strip()[:10])
+
+def insert_transactions_bulk(user_id: int, rows) -> int:
+    """
+    Insert many (date, amount, category, description) rows in one transaction.
+    Dates may be date, datetime/Timestamp or ISO strings; they are stored as dates.
+    Returns the number of rows inserted.
+    """
+    params = [(user_id, _as_date(d), *rest) for d, *rest in rows]
+    conn = get_conn()
+    with _db_lock(), conn:
+        cur = conn.executemany(SQL_INSERT_TX, params)
+        _bump_tx_version(user_id)
+        return cur.rowcount
 
 def reset_user_data(user_id: int):
-    with db() as conn:
-        conn.execute("DELETE FROM transactions WHERE user_id=?", (user_id,))
+    conn = get_conn()
+    with _db_lock(), conn:
+        conn.execute(SQL_DELETE_USER_TX, (user_id,))
+        _bump_tx_version(user_id)
+
+def update_passcode(user_id: int, passcode_hash: bytes):
+    conn = get_conn()
+    with _db_lock(), conn:
+        conn.execute(SQL_UPDATE_PASSCODE, (passcode_hash, user_id))
 
 
 #  APP STATE
 init_db()
+_dummy_hash()  # warm up so the first unknown-username login isn't slower
 if "user_id" not in st.session_state:
     st.session_state.user_id = None
 if "username" not in st.session_state:
     st.session_state.username = None
+if "session_token" not in st.session_state:
+    st.session_state.session_token = None
+
+def end_session():
+    revoke_session_token(st.session_state.user_id, st.session_state.session_token)
+    st.session_state.session_token = None
+    st.session_state.user_id = None
+    st.session_state.username = None
+
+def expire_session():
+    # Token expired, was capped out or was revoked elsewhere: back to the login form
+    end_session()
+    st.session_state.session_expired = True
+    st.rerun()
 
 st.title("Finance Tracker")
 
 # AUTH (Login / Register) 
 if st.session_state.user_id is None:
     st.header("Account")
+    if st.session_state.pop("session_expired", False):
+        st.warning("Your session has expired. Please sign in again.")
     mode = st.radio("Choose an action", ["Login", "Register"], horizontal=True)
 
     if mode == "Register":
@@ -130,7 +403,7 @@ if st.session_state.user_id is None:
         if st.button("Create account", key="reg_btn"):
             if len(p1 or "") != 10:
                 st.error("Passcode must be exactly 10 characters.")
-            elif p1 != p2:
+            elif not hmac.compare_digest(p1.encode("utf-8"), (p2 or "").encode("utf-8")):
                 st.error("Passcodes do not match.")
             else:
                 new_id = create_user(u.strip(), p1)
@@ -153,6 +426,7 @@ if st.session_state.user_id is None:
                     st.error("Invalid username or passcode.")
                 else:
                     st.session_state.user_id = uid
+                    st.session_state.session_token = issue_session_token(uid)
                     st.session_state.username = u.strip()
                     st.success(f"Welcome back, {st.session_state.username}!")
                     st.rerun()
@@ -160,20 +434,21 @@ if st.session_state.user_id is None:
     st.stop()  # Halt rendering until logged in
 
 # LOADED (AUTH OK) 
+if not check_session_token(st.session_state.user_id, st.session_state.session_token):
+    expire_session()
 st.caption(f"Logged in as: {st.session_state.username}")
 
 # Load this user's transactions
-df = list_transactions(st.session_state.user_id)
-if not df.empty:
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0.0)
+df = list_transactions(st.session_state.user_id, tx_version(st.session_state.user_id))
 
 # Sidebar filters (shared)
+start_date = end_date = None
+picked_cats = []
 with st.sidebar:
     st.header("Filters")
     if df.empty or df["date"].dropna().empty:
         st.info("No data yet. Add a transaction.")
-        df_filtered = df.copy()
+        df_filtered = df
     else:
         valid_dates = df["date"].dropna()
         min_date = valid_dates.min().date()
@@ -181,18 +456,16 @@ with st.sidebar:
         dr = st.date_input("Date range", (min_date, max_date))
         start_date, end_date = (dr if isinstance(dr, tuple) else (dr, dr))
 
-        mask = (
-            df["date"].notna()
-            & (df["date"].dt.date >= start_date)
-            & (df["date"].dt.date <= end_date)
+        cats = distinct_categories(
+            st.session_state.user_id, start_date, end_date, tx_version(st.session_state.user_id)
         )
-        df_range = df[mask]
-
-        cats = sorted(df_range["category"].dropna().unique().tolist())
         picked_cats = st.multiselect("Filter by category", cats, default=cats)
         df_filtered = (
-            df_range[df_range["category"].isin(picked_cats)]
-            if picked_cats else df_range.iloc[0:0]
+            list_transactions_filtered(
+                st.session_state.user_id, start_date, end_date, tuple(picked_cats),
+                tx_version(st.session_state.user_id),
+            )
+            if picked_cats else empty_tx()
         )
 
 # Tabs
@@ -224,7 +497,7 @@ with tab_tx:
             else:
                 insert_transaction(
                     st.session_state.user_id,
-                    str(date),
+                    date,
                     float(amount),
                     category,
                     description.strip(),
@@ -233,22 +506,23 @@ with tab_tx:
                 st.rerun()
 
     st.subheader("Transactions")
-    st.dataframe(df_filtered, width="stretch")
+    st.dataframe(
+        tx_table(
+            st.session_state.user_id, start_date, end_date, tuple(picked_cats),
+            tx_version(st.session_state.user_id),
+        )
+        if picked_cats else df_filtered,
+        width="stretch",
+    )
 
     total = df_filtered["amount"].sum() if not df_filtered.empty else 0.0
     st.caption(f"Total shown: ${total:,.2f}")
 
     if not df_filtered.empty:
-        df_ms = df_filtered.copy()
-        df_ms["date"] = pd.to_datetime(df_ms["date"], errors="coerce")
-        month_summary = (
-            df_ms.dropna(subset=["date"])
-                 .groupby(pd.Grouper(key="date", freq="MS"))["amount"]
-                 .sum()
-                 .reset_index()
+        month_summary = monthly_sum(
+            st.session_state.user_id, start_date, end_date, tuple(picked_cats),
+            tx_version(st.session_state.user_id),
         )
-        month_summary["month"] = month_summary["date"].dt.strftime("%Y-%m")
-        month_summary = month_summary[["month", "amount"]]
         st.subheader("Monthly summary")
         st.dataframe(month_summary, width="stretch")
 
@@ -256,22 +530,20 @@ with tab_tx:
 with tab_insights:
     st.subheader("Spending by category")
     if not df_filtered.empty:
-        category_summary = (
-            df_filtered.groupby("category", dropna=False)["amount"]
-                       .sum()
-                       .reset_index()
-                       .sort_values("amount", ascending=False)
+        category_summary = category_totals(
+            st.session_state.user_id, start_date, end_date, tuple(picked_cats),
+            tx_version(st.session_state.user_id),
         )
         total_amount = float(category_summary["amount"].sum())
         category_summary["percent"] = (category_summary["amount"] / total_amount * 100).round(1)
 
-        fig = px.pie(
-            category_summary,
-            names="category",
-            values="amount",
+        fig = go.Figure(go.Pie(
+            labels=category_summary["category"].tolist(),
+            values=category_summary["amount"].tolist(),
             hole=0.6,
-        )
-        fig.update_traces(textinfo="percent+label", textposition="inside")
+            textinfo="percent+label",
+            textposition="inside",
+        ))
         st.plotly_chart(fig, use_container_width=True)
 
         st.write("Top categories")
@@ -296,15 +568,10 @@ with tab_dash:
             avg = df_filtered["amount"].mean()
             st.metric("Avg per transaction", f"${avg:,.2f}")
 
-        df_tr = df_filtered.copy()
-        df_tr["date"] = pd.to_datetime(df_tr["date"], errors="coerce")
-        trend = (
-            df_tr.dropna(subset=["date"])
-                 .groupby(pd.Grouper(key="date", freq="MS"))["amount"]
-                 .sum()
-                 .reset_index()
+        trend = monthly_sum(
+            st.session_state.user_id, start_date, end_date, tuple(picked_cats),
+            tx_version(st.session_state.user_id),
         )
-        trend["month"] = trend["date"].dt.strftime("%Y-%m")
         st.line_chart(trend.set_index("month")["amount"])
 
 #  SETTINGS 
@@ -315,15 +582,18 @@ with tab_settings:
     colA, colB = st.columns(2)
     with colA:
         if st.button("⚠️ Reset my transactions"):
-            reset_user_data(st.session_state.user_id)
-            st.success("All your transactions were cleared.")
-            st.rerun()
+            if not check_session_token(st.session_state.user_id, st.session_state.session_token):
+                expire_session()
+            else:
+                reset_user_data(st.session_state.user_id)
+                st.success("All your transactions were cleared.")
+                st.rerun()
 
     with colB:
         if not df.empty:
             st.download_button(
                 label="Download my CSV",
-                data=df.to_csv(index=False).encode("utf-8"),
+                data=export_csv(st.session_state.user_id, tx_version(st.session_state.user_id)),
                 file_name=f"{st.session_state.username}_finance_export.csv",
                 mime="text/csv",
             )
@@ -338,16 +608,16 @@ with tab_settings:
     if st.button("Save new passcode", key="save_passcode"):
         if len(new_p or "") != 10:
             st.error("Passcode must be exactly 10 characters.")
+        elif not check_session_token(st.session_state.user_id, st.session_state.session_token):
+            expire_session()
         else:
-            with db() as conn:
-                h = bcrypt.hashpw(new_p.encode("utf-8"), bcrypt.gensalt())
-                conn.execute("UPDATE users SET passcode_hash=? WHERE id=?", (h, st.session_state.user_id))
+            update_passcode(st.session_state.user_id, hash_passcode(new_p))
+            revoke_other_session_tokens(st.session_state.user_id, st.session_state.session_token)
             st.success("Passcode updated.")
 
     st.divider()
     if st.button("Sign out", key="signout_bottom"):
-        st.session_state.user_id = None
-        st.session_state.username = None
+        end_session()
         st.success("Signed out.")
         st.rerun()
 